@@ -15,69 +15,128 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 # Implements a helper class to obtain Trill sensor touches
+import array
+import micropython
+
+# Decode n big-endian 16-bit values from src into dst and count the valid touches among the first slots values
+# Empty slots read 0xFFFF, which the count masks out without branching
+@micropython.viper
+def _decode(src: ptr8, dst: ptr16, n: int, slots: int) -> int:
+    for i in range(n):
+        j = i << 1
+        dst[i] = (src[j] << 8) | src[j + 1]
+    count = 0
+    for i in range(slots):
+        count += ((dst[i] + 1) >> 16) ^ 1
+    return count
+
 # Generic Touches class
+# Touches are stored as columns, i.e., one view per position or size, instead of a list of tuples
+# All columns share a single array laid out as the MODE_CENTROID data, empty slots hold -1
+# The columns ys, wy, xs, and wx are memoryviews over all slots, including empty ones,
+# hence index them or use get_touches(), as they neither print their values nor compare by value
 class Touches(object):
 
     # Converts data read using MODE_CENTROID to a list of touches
+    # Data being None creates an empty instance, e.g., to be populated using decode()
     # Please instantiate subclasses only
+    @micropython.native
     def __init__(self, data):
-        self.touches = []
+        self._data = None
+        self._count = 0
+        if data is None:
+            self._allocate(0)
+            return
+
+        n = len(data)
+        self._allocate(n)
+        values = self._data
+        for i in range(n):
+            values[i] = data[i]
+
+        locations = self.ys
+        count = 0
+        for i in range(len(locations)):
+            count += locations[i] != -1
+        self._count = count
+
+    # Converts the raw big-endian bytes of a MODE_CENTROID scan to a list of touches
+    def decode(self, buf):
+        n = len(buf) >> 1
+        self._allocate(n)
+        self._count = _decode(buf, self._data, n, len(self.ys))
 
     # Returns a list of touches as tuples, with
     #  (vertical position, touch size) in case of one-directional data, or
     #  (horizontal position, vertical position, horizontal size, vertical size)
     #  in case of two-directional data
     def get_touches(self):
-        return self.touches
+        locations = self.ys
+        return [self._touch(i) for i in range(len(locations)) if locations[i] != -1]
 
     # Returns the number of touches
     def get_num_touches(self):
-        return len(self.touches)
+        return self._count
 
     # Returns the touch at index as a tuple
+    # Negative indices count from the last touch
     def get_touch(self, index):
         touch = None
-        if index < len(self.touches):
-            touch = self.touches[index]
+        if index < 0:
+            index += self._count
+        if 0 <= index < self._count:
+            locations = self.ys
+            for i in range(len(locations)):
+                if locations[i] != -1:
+                    if index == 0:
+                        touch = self._touch(i)
+                        break
+                    index -= 1
         return touch
 
     # Returns True if no touches are registered
     def is_empty(self):
-        return len(self.touches) == 0
+        return self._count == 0
+
+    # Allocates the shared array for n values, keeping the current one if it already fits
+    def _allocate(self, n):
+        if self._data is None or len(self._data) != n:
+            self._data = array.array('h', [0] * n)
+            self._columns(memoryview(self._data), n)
+
+    # Sets the column views on the shared array of n values
+    def _columns(self, data, n):
+        self.ys = data[:0]
+        self.wy = data[:0]
+
+    # Builds the tuple of the touch at slot index
+    def _touch(self, index):
+        return None
 
 
 # Touches given one-directional data, e.g., using Bar, Ring, or Craft
+# Data holds all vertical locations, followed by all sizes
 class Touches1D(Touches):
 
-    def __init__(self, data):
-        super(Touches1D, self).__init__(data)
-
-        verticalLocations = data[:int(len(data)/2)]
-        verticalSizes = data[int(len(data)/2):]
+    def _columns(self, data, n):
+        half = n >> 1
+        self.ys = data[:half]
+        self.wy = data[half:]
 
-        self.touches = []
-        for i in range[0:len(verticalLocations)]:
-            if verticalLocations[i] is not -1:
-                self.touches.append((verticalLocations[i], verticalSizes[i]))
+    def _touch(self, index):
+        return (self.ys[index], self.wy[index])
 
 
 # Touches given two-directional data, e.g., using Square or Hex
+# Data holds the vertical locations and sizes, followed by the horizontal locations and sizes
 class Touches2D(Touches):
 
-    def __init__(self, data):
-        super(Touches2D, self).__init__(data)
-
-        vertical = data[:int(len(data)/2)]
-        horizontal = data[int(len(data)/2):]
-
-        verticalLocations = vertical[:int(len(vertical)/2)]
-        verticalSizes = vertical[int(len(vertical)/2):]
-
-        horizontalLocations = horizontal[:int(len(horizontal)/2)]
-        horizontalSizes = horizontal[int(len(horizontal)/2):]
-
-        self.touches = []
-        for i in range(0,len(verticalLocations)):
-            if verticalLocations[i] is not -1:
-                self.touches.append((horizontalLocations[i], verticalLocations[i], horizontalSizes[i], verticalSizes[i]))
+    def _columns(self, data, n):
+        quarter = n >> 2
+        self.ys = data[:quarter]
+        self.wy = data[quarter:2 * quarter]
+        self.xs = data[2 * quarter:3 * quarter]
+        self.wx = data[3 * quarter:]
 
+    def _touch(self, index):
+        return (self.xs[index], self.ys[index], self.wx[index], self.wy[index])
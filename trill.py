@@ -17,27 +17,48 @@
 # Implements an I2C Trill sensor
 import time
 import struct
-
-REG_COMMAND = 0x00
-REG_DATA = 0x04
-
-COMMAND_NONE = 0x00
-COMMAND_MODE = 0x01
-COMMAND_SCAN_SETTINGS = 0x02
-COMMAND_PRESCALER = 0x03
-COMMAND_NOISE_THRESHOLD = 0x04
-COMMAND_IDAC = 0x05
-COMMAND_BASELINE_UPDATE = 0x06
-COMMAND_MINIMUM_SIZE = 0x07
-COMMAND_AUTO_SCAN_INTERVAL = 0x10
-COMMAND_IDENTIFY = 0xFF
-
-MODE_CENTROID = 0x00
-MODE_RAW = 0x01
-MODE_BASELINE = 0x02
-MODE_DIFF = 0x03
-
-TYPES = ["Unknown", "Bar", "Square", "Craft", "Ring", "Hex", "Flex"]
+import array
+import micropython
+from micropython import const
+
+REG_COMMAND = const(0x00)
+REG_DATA = const(0x04)
+
+COMMAND_NONE = const(0x00)
+COMMAND_MODE = const(0x01)
+COMMAND_SCAN_SETTINGS = const(0x02)
+COMMAND_PRESCALER = const(0x03)
+COMMAND_NOISE_THRESHOLD = const(0x04)
+COMMAND_IDAC = const(0x05)
+COMMAND_BASELINE_UPDATE = const(0x06)
+COMMAND_MINIMUM_SIZE = const(0x07)
+COMMAND_AUTO_SCAN_INTERVAL = const(0x10)
+COMMAND_IDENTIFY = const(0xFF)
+
+MODE_CENTROID = const(0x00)
+MODE_RAW = const(0x01)
+MODE_BASELINE = const(0x02)
+MODE_DIFF = const(0x03)
+
+TYPES = ("Unknown", "Bar", "Square", "Craft", "Ring", "Hex", "Flex")
+
+# Packed register addresses and commands, packed once instead of on every use
+_B_REG_DATA = struct.pack("1B", REG_DATA)
+_B_IDENTIFY = struct.pack("1B", COMMAND_IDENTIFY)
+
+# Scratch buffer for commands shared by all sensors, with views for the shorter commands
+# I2C transactions are serialized, so sensors never use it concurrently
+_SHARED_CMD = bytearray(3)
+_SHARED_CMD1 = memoryview(_SHARED_CMD)[:1]
+_SHARED_CMD2 = memoryview(_SHARED_CMD)[:2]
+
+# Decode n big-endian 16-bit values from src into the array('h') dst
+# Storing the raw bit pattern is enough, reading the array back yields signed values
+@micropython.viper
+def _be16_to_i16(src: ptr8, dst: ptr16, n: int):
+    for i in range(n):
+        j = i << 1
+        dst[i] = (src[j] << 8) | src[j + 1]
 
 # Class that represents a generic Trill sensor
 class TrillSensor(object):
@@ -45,37 +66,49 @@ class TrillSensor(object):
     # Initialize a generic Trill sensor, with
     #  i2c being an I2C bus instance
     #  address being the I2C address of the sensor,
-    #  mode being the sensor mode, and
-    #  sleep being the delay to use between I2C bus communication
-    def __init__(self, i2c, address=0x00, mode=None, sleep=10):
+    #  mode being the sensor mode,
+    #  sleep being the delay to use between I2C bus communication,
+    #  channels being the number of channels of the sensor,
+    #  maxTouches being the maximum number of touches per direction, and
+    #  directions being the number of directions (1 or 2) touches are reported in
+    def __init__(self, i2c, address=0x00, mode=None, sleep=10, channels=0, maxTouches=0, directions=0):
         self.i2c = i2c
         self.address=address
         self.mode = mode
         self.sleep = sleep
         self.type = 0
         self.identifiedType = 0
+        self._type_name = TYPES[0]
+        self._expected_name = TYPES[0]
         self.firmware = None
         self.size = (1, 1)
-        self.channels = 0
-        self.maxTouches = 0
-        self.directions = 0
+        self.channels = channels
+        self.maxTouches = maxTouches
+        self.directions = directions
+
+        # Bound once so the read paths avoid repeated attribute lookups
+        self._writeto = i2c.writeto
+        self._readfrom_mem_into = i2c.readfrom_mem_into
+
+        self._init_buffers()
 
     # Ask the sensor to identify itself and read its type and firmware version
+    # The reply is read from the command register, which the identify command itself selects
     def identify(self):
-        self.i2c.writeto(self.address, struct.pack("1B", REG_DATA))
-        time.sleep_ms(10)
-        self.i2c.writeto_mem(self.address, REG_COMMAND, struct.pack("1B", COMMAND_IDENTIFY))
+        self.i2c.writeto_mem(self.address, REG_COMMAND, _B_IDENTIFY)
         time.sleep_ms(self.sleep + 15)
         (_, self.identifiedType, self.firmware) = self.i2c.readfrom(self.address, 3)
-        print("Trill type", TYPES[self.identifiedType], "with firmware version", self.firmware)
-        if self.type is not self.identifiedType:
-            print("Warning: connected Trill device does not identify as", TYPES[self.type], "!!!")
+        self._type_name = TYPES[self.identifiedType]
+        self._expected_name = TYPES[self.type]
+        print("Trill type", self._type_name, "with firmware version", self.firmware)
+        if self.type != self.identifiedType:
+            print("Warning: connected Trill device does not identify as", self._expected_name, "!!!")
 
     # Get the sensor type
     def get_type(self):
-        if self.identifiedType is 0:
+        if self.identifiedType == 0:
             self.identify()
-        return TYPES[self.identifiedType]
+        return self._type_name
 
     # Get the sensor firmware version
     def get_firmware_version(self):
@@ -92,16 +125,106 @@ class TrillSensor(object):
         return self.channels
 
     # Read the latest scan value from the sensor
+    # Returns the sensor's array('h') for the current mode, which is overwritten by the next read
+    # set_mode() replaces this method on the instance by the read for that mode,
+    # hence subclasses should override _read_centroid() and _read_raw() instead of read()
     def read(self):
-        self.i2c.writeto(self.address, struct.pack("1B", REG_DATA))
+        if self.mode == MODE_CENTROID:
+            return self._read_centroid()
+        return self._read_raw()
+
+    # Read the latest MODE_CENTROID scan
+    @micropython.native
+    def _read_centroid(self):
+        self._writeto(self.address, _B_REG_DATA)
+        time.sleep_ms(self.sleep)
+        buf = self._centroid_buf
+        data = self._centroid_out
+        self._readfrom_mem_into(self.address, REG_DATA, buf)
+        _be16_to_i16(buf, data, len(data))
+        return data
+
+    # Read the latest MODE_RAW, MODE_BASELINE, or MODE_DIFF scan
+    @micropython.native
+    def _read_raw(self):
+        self._writeto(self.address, _B_REG_DATA)
+        time.sleep_ms(self.sleep)
+        buf = self._buf
+        data = self._out
+        self._readfrom_mem_into(self.address, REG_DATA, buf)
+        _be16_to_i16(buf, data, len(data))
+        return data
+
+    # Read the latest scan value from the sensor into out, with
+    #  out being an array('h') holding at least as many values as a scan in the current mode
+    # out must be an array('h'): the values are written unchecked as 16-bit words,
+    # only the number of items is verified, so any other buffer type overruns memory
+    # Returns out
+    @micropython.native
+    def read_into(self, out):
+        buf = self._buf
+        if self.mode == MODE_CENTROID:
+            buf = self._centroid_buf
+        n = len(buf) >> 1
+        if len(out) < n:
+            raise ValueError("out holds fewer than %d values" % n)
+
+        _be16_to_i16(self._scan(buf), out, n)
+        return out
+
+    # Read the latest MODE_CENTROID scan and convert it to touches in a single pass, with
+    #  touches being a Touches1D or Touches2D instance to reuse, or None to create one
+    def read_touches(self, touches=None):
+        if self.mode != MODE_CENTROID:
+            raise ValueError("touches can only be read in MODE_CENTROID")
+
+        buf = self._scan(self._centroid_buf)
+
+        # Imported here so trill.py remains usable without touch.py when touches are not needed
+        if touches is None:
+            from touch import Touches1D, Touches2D
+            if self.directions == 1:
+                touches = Touches1D(None)
+            else:
+                touches = Touches2D(None)
+
+        touches.decode(buf)
+        return touches
+
+    # Read the raw bytes of the latest scan from the sensor into buf, for read_into() and read_touches()
+    # The mode specific reads inline these steps to keep read() free of an extra call
+    # Returns buf
+    @micropython.native
+    def _scan(self, buf):
+        self._writeto(self.address, _B_REG_DATA)
         time.sleep_ms(self.sleep)
+        self._readfrom_mem_into(self.address, REG_DATA, buf)
+        return buf
+
+    # Allocate the buffers used to read scans, given channels, maxTouches, and directions
+    # MODE_CENTROID scans are read into the start of the same byte buffer, but decoded into their own array
+    def _init_buffers(self):
+        centroidLength = 2 * self.maxTouches * self.directions
+        self._buf = bytearray(2 * self.channels)
+        self._out = array.array('h', [0] * self.channels)
+        self._centroid_buf = memoryview(self._buf)[:2 * centroidLength]
+        self._centroid_out = array.array('h', [0] * centroidLength)
 
     # Set the sensor mode
+    # The mode and the read for that mode are only updated once the sensor accepted the command
     def set_mode(self, mode):
-        self.mode = mode
-        self.i2c.writeto_mem(self.address, REG_COMMAND, struct.pack("2B", COMMAND_MODE, mode))
+        cmd = _SHARED_CMD
+        cmd[0] = COMMAND_MODE
+        cmd[1] = mode
+        self.i2c.writeto_mem(self.address, REG_COMMAND, _SHARED_CMD2)
         time.sleep_ms(self.sleep)
 
+        self.mode = mode
+        if mode == MODE_CENTROID:
+            self.read = self._read_centroid
+        else:
+            self.read = self._read_raw
+
     # Get the sensor mode
     # Returns None if mode hasn't been set
     def get_mode(self):
@@ -111,191 +234,136 @@ class TrillSensor(object):
     #  speed being a value from 0 to 3, and
     #  resolution being a value from 9 to 16
     def set_scan_settings(self, speed=0, resolution=12):
-        if speed < 0:
-            speed = 0
-        elif speed > 3:
-            speed = 3
-
-        if resolution < 9:
-            resolution = 9
-        elif resolution > 16:
-            resolution = 16
-
-        self.i2c.writeto_mem(self.address, REG_COMMAND, struct.pack("3B", COMMAND_SCAN_SETTINGS, speed, resolution))
+        speed = max(0, min(3, speed))
+        resolution = max(9, min(16, resolution))
+
+        cmd = _SHARED_CMD
+        cmd[0] = COMMAND_SCAN_SETTINGS
+        cmd[1] = speed
+        cmd[2] = resolution
+        self.i2c.writeto_mem(self.address, REG_COMMAND, _SHARED_CMD)
         time.sleep_ms(self.sleep)
 
     # Update the baseline capacitance values of the sensor
     def update_baseline(self):
-        self.i2c.writeto_mem(self.address, REG_COMMAND, struct.pack("1B", COMMAND_BASELINE_UPDATE))
+        _SHARED_CMD[0] = COMMAND_BASELINE_UPDATE
+        self.i2c.writeto_mem(self.address, REG_COMMAND, _SHARED_CMD1)
         time.sleep_ms(self.sleep)
 
     # Set the prescaler of the sensor, with
     #  prescaler being a value from 1 to 8
     def set_prescaler(self, prescaler=8):
-        self.i2c.writeto_mem(self.address, REG_COMMAND, struct.pack("2B", COMMAND_PRESCALER, prescaler))
+        cmd = _SHARED_CMD
+        cmd[0] = COMMAND_PRESCALER
+        cmd[1] = prescaler
+        self.i2c.writeto_mem(self.address, REG_COMMAND, _SHARED_CMD2)
         time.sleep_ms(self.sleep)
 
     # Set the noise threshold for the MODE_CENTROID and MODE_DIFF modes, with
     #  threshold being a value from 0 to 255
     def set_noise_threshold(self, threshold):
-        self.i2c.writeto_mem(self.address, REG_COMMAND, struct.pack("2B", COMMAND_NOISE_THRESHOLD, threshold))
+        cmd = _SHARED_CMD
+        cmd[0] = COMMAND_NOISE_THRESHOLD
+        cmd[1] = threshold
+        self.i2c.writeto_mem(self.address, REG_COMMAND, _SHARED_CMD2)
         time.sleep_ms(self.sleep)
 
     # Set the IDAC value of the sensor, with
     #  value being a value from 0 to 255
     def set_IDAC_value(self, value):
-        self.i2c.writeto_mem(self.address, REG_COMMAND, struct.pack("2B", COMMAND_IDAC, value))
+        cmd = _SHARED_CMD
+        cmd[0] = COMMAND_IDAC
+        cmd[1] = value
+        self.i2c.writeto_mem(self.address, REG_COMMAND, _SHARED_CMD2)
         time.sleep_ms(self.sleep)
 
     # Set the minimum registered touch size
     def set_minimum_touch_size(self, minSize):
-        self.i2c.writeto_mem(self.address, REG_COMMAND, struct.pack("BH", COMMAND_MINIMUM_SIZE, minSize))
+        cmd = _SHARED_CMD
+        cmd[0] = COMMAND_MINIMUM_SIZE
+        cmd[1] = (minSize >> 8) & 0xFF
+        cmd[2] = minSize & 0xFF
+        self.i2c.writeto_mem(self.address, REG_COMMAND, _SHARED_CMD)
         time.sleep_ms(self.sleep)
 
     # Set the automatic scan interval (used with the EVT pin)
     def set_auto_scan_interval(self, interval=1):
-        self.i2c.writeto_mem(self.address, REG_COMMAND, struct.pack("2B", COMMAND_AUTO_SCAN_INTERVAL, interval))
+        cmd = _SHARED_CMD
+        cmd[0] = COMMAND_AUTO_SCAN_INTERVAL
+        cmd[1] = interval
+        self.i2c.writeto_mem(self.address, REG_COMMAND, _SHARED_CMD2)
         time.sleep_ms(self.sleep)
 
     # Returns True if the sensor is one-directional
     def is_1D(self):
-        return self.directions is 1
+        return self.directions == 1
 
     # Returns True if the sensor is two-directional
     def is_2D(self):
-        return self.directions is 2
+        return self.directions == 2
 
 
 # Class representing a Trill Bar
 class Bar(TrillSensor):
 
     def __init__(self, i2c, address=0x20, mode=MODE_CENTROID, sleep=10):
-        super(Bar, self).__init__(i2c, address, mode, sleep)
+        super(Bar, self).__init__(i2c, address, mode, sleep, 26, 5, 1)
         self.type = 1
         self.size = (1, 3200)
-        self.channels = 26
-        self.maxTouches = 5
-        self.directions = 1
 
         self.set_mode(mode)
         self.set_scan_settings()
         self.update_baseline()
 
-    def read(self):
-        super(Bar, self).read()
-        data = None
-
-        if self.mode is MODE_CENTROID:
-            data = struct.unpack(">10h", self.i2c.readfrom_mem(self.address, REG_DATA, 4 * self.maxTouches))
-        else:
-            data = struct.unpack(">26h", self.i2c.readfrom_mem(self.address, REG_DATA, 2 * self.channels))
-
-        return data
-
 
 # Class representing a Trill Square
 class Square(TrillSensor):
 
     def __init__(self, i2c, address=0x28, mode=MODE_CENTROID, sleep=10):
-        super(Square, self).__init__(i2c, address, mode, sleep)
+        super(Square, self).__init__(i2c, address, mode, sleep, 30, 4, 2)
         self.type = 2
         self.size = (1792, 1792)
-        self.channels = 30
-        self.maxTouches = 4
-        self.directions = 2
 
         self.set_mode(mode)
         self.set_scan_settings()
         self.update_baseline()
 
-    def read(self):
-        super(Square, self).read()
-        data = None
-
-        if self.mode is MODE_CENTROID:
-            data = struct.unpack(">16h", self.i2c.readfrom_mem(self.address, REG_DATA, 4 * self.directions * self.maxTouches))
-        else:
-            data = struct.unpack(">30h", self.i2c.readfrom_mem(self.address, REG_DATA, 2 * self.channels))
-
-        return data
-
 
 # Class representing a Trill Craft
 class Craft(TrillSensor):
 
     def __init__(self, i2c, address=0x30, mode=MODE_CENTROID, sleep=10):
-        super(Craft, self).__init__(i2c, address, mode, sleep)
+        super(Craft, self).__init__(i2c, address, mode, sleep, 30, 5, 1)
         self.type = 3
         self.size = (1, 4096)
-        self.channels = 30
-        self.maxTouches = 5
-        self.directions = 1
 
         self.set_mode(mode)
         self.set_scan_settings()
         self.update_baseline()
 
-    def read(self):
-        super(Craft, self).read()
-        data = None
-
-        if self.mode is MODE_CENTROID:
-            data = struct.unpack(">10h", self.i2c.readfrom_mem(self.address, REG_DATA, 4 * self.maxTouches))
-        else:
-            data = struct.unpack(">26h", self.i2c.readfrom_mem(self.address, REG_DATA, 2 * self.channels))
-
-        return data
-
 
 # Class representing a Trill Ring
 class Ring(TrillSensor):
 
     def __init__(self, i2c, address=0x38, mode=MODE_CENTROID, sleep=10):
-        super(Ring, self).__init__(i2c, address, mode, sleep)
+        super(Ring, self).__init__(i2c, address, mode, sleep, 28, 5, 1)
         self.type = 4
         self.size = (1, 3584)
-        self.channels = 28
-        self.maxTouches = 5
-        self.directions = 1
 
         self.set_mode(mode)
         self.set_scan_settings()
         self.update_baseline()
 
-    def read(self):
-        super(Ring, self).read()
-        data = None
-
-        if self.mode is MODE_CENTROID:
-            data = struct.unpack(">10h", self.i2c.readfrom_mem(self.address, REG_DATA, 4 * self.maxTouches))
-        else:
-            data = struct.unpack(">28h", self.i2c.readfrom_mem(self.address, REG_DATA, 2 * self.channels))
-
-        return data
-
 
 # Class representing a Trill Hex
 class Hex(TrillSensor):
 
     def __init__(self, i2c, address=0x40, mode=MODE_CENTROID, sleep=10):
-        super(Hex, self).__init__(i2c, address, mode, sleep)
+        super(Hex, self).__init__(i2c, address, mode, sleep, 30, 4, 2)
         self.type = 5
         self.size = (1664, 1920)
-        self.channels = 30
-        self.maxTouches = 4
-        self.directions = 2
 
         self.set_mode(mode)
         self.set_scan_settings()
         self.update_baseline()
 
-    def read(self):
-        super(Hex, self).read()
-        data = None
-
-        if self.mode is MODE_CENTROID:
-            data = struct.unpack(">16h", self.i2c.readfrom_mem(self.address, REG_DATA, 4 * self.directions * self.maxTouches))
-        else:
-            data = struct.unpack(">30h", self.i2c.readfrom_mem(self.address, REG_DATA, 2 * self.channels))
-
-        return data